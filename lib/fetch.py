@@ -1,19 +1,13 @@
 """Fetch helper for making HTTP requests."""
 from __future__ import annotations
 from typing import Optional
-from urllib.request import Request, urlopen
-from urllib.error import HTTPError, URLError
+from http.client import HTTPException
 
+from lib.headers import filter_hop
+from lib.helpers.pool import open_url, release
 from lib.response import Response
 
 
-# Headers to skip when proxying (hop-by-hop headers)
-_HOP_BY_HOP = frozenset([
-  "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
-  "te", "trailers", "transfer-encoding", "upgrade", "host", "content-length"
-])
-
-
 def fetch(
   url: str,
   method: str = "GET",
@@ -23,22 +17,22 @@ def fetch(
 ) -> Response:
   """
   Fetch a URL and return a Response object.
+  Connections are kept alive and reused for later fetches to the same host.
   
   Example:
     resp = fetch("https://api.example.com/data")
     resp.header("X-Custom", "added")
     request.response.rewrite(resp)
   """
-  req_headers = headers or {}
+  conn = None
   try:
-    req = Request(url, data=body, headers=req_headers, method=method)
-    with urlopen(req, timeout=timeout) as resp:
-      resp_headers = {k: v for k, v in resp.getheaders() if k.lower() not in _HOP_BY_HOP}
-      return Response(resp.read(), resp.status, resp_headers)
-  except HTTPError as e:
-    resp_headers = {k: v for k, v in e.headers.items() if k.lower() not in _HOP_BY_HOP}
-    return Response(e.read(), e.code, resp_headers)
-  except URLError as e:
-    return Response(f"Bad Gateway: {e.reason}", 502)
-  except TimeoutError:
-    return Response("Gateway Timeout", 504)
+    conn, resp = open_url(url, method=method, headers=headers, body=body, timeout=timeout)
+    data = resp.read()
+  except (OSError, HTTPException) as e:
+    if conn is not None:
+      conn.close()
+    if isinstance(e, TimeoutError):
+      return Response("Gateway Timeout", 504)
+    return Response(f"Bad Gateway: {e}", 502)
+  release(conn, resp)
+  return Response(data, resp.status, dict(filter_hop(resp.getheaders())))
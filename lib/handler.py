@@ -1,10 +1,28 @@
+from __future__ import annotations
 import http.server
+import re
 import traceback
+from collections.abc import Callable
+from http import HTTPStatus
+from typing import Optional
 
 from lib.error import HttpServerError, default_error_handler
 from lib.helpers.query import parse_path_and_query
 from lib.response import ResponseHelper
-from lib.headers import Headers
+from lib.headers import Headers, _canon
+
+# Limits on the request head (request line + headers); larger heads get 414/431
+_MAX_HEAD = 65536
+_MAX_HEADERS = 100
+
+# Client went away or the connection timed out: expected, so not logged and no error response
+_QUIET = (BrokenPipeError, ConnectionResetError, ConnectionAbortedError, TimeoutError)
+# Of those, the ones an app can only get from the client socket. An app may raise TimeoutError
+# or ConnectionAbortedError itself (e.g. an upstream call), which deserves a log line and a 500.
+_CLIENT_GONE = (BrokenPipeError, ConnectionResetError)
+
+# End of the request head; bare LF line endings are tolerated like the stdlib parser does
+_HEAD_END = re.compile(rb"\r?\n\r?\n")
 
 
 class HttpServerHandler(http.server.BaseHTTPRequestHandler):
@@ -15,78 +33,276 @@ class HttpServerHandler(http.server.BaseHTTPRequestHandler):
     .query_params (param name -> str or list[str]; arrays only for ?key[]=),
     .response (request.response.html(), .json(), .text(), .redirect()),
     .send_response(), etc.
+
+  Speaks HTTP/1.1 with keep-alive: the response helpers always send Content-Length
+  (streamProxy sends chunked bodies when the upstream length is unknown).
+  For HEAD requests the helpers send the headers only.
+  If a handler writes to .wfile itself without sending Content-Length (or chunked
+  Transfer-Encoding), the connection is closed after the response so the client sees
+  where the body ends. It must not write a body for HEAD.
+  .wfile is buffered and flushed when the handler returns; call .wfile.flush() to
+  send part of a response early.
   """
 
+  protocol_version = "HTTP/1.1"
+  # Buffered wfile (the stdlib default is unbuffered): a response's status line, headers and
+  # body leave in as few send() calls as possible. Flushed after each request, and before
+  # anything that writes to the socket directly (sendfile, sendmsg).
+  wbufsize = 65536
+  # Seconds an idle keep-alive connection may wait for its next request. The connection
+  # holds a pool thread meanwhile, so this stays short, and the server (park_idle) ends it
+  # early when a new connection needs the thread.
+  keep_alive_timeout: float = 5
+
+  # The app's handler(request) and error_handler(request, error), set per server by bind()
+  _handler_func: Optional[Callable[[HttpServerHandler], None]] = None
+  _error_handler_func: Callable[[HttpServerHandler, HttpServerError], None] = staticmethod(default_error_handler)
+  # Set once the current response declares where its body ends (Content-Length or chunked)
+  _framed = False
+
+  @classmethod
+  def bind(
+    cls,
+    handler_func: Callable[[HttpServerHandler], None],
+    error_handler_func: Optional[Callable[[HttpServerHandler, HttpServerError], None]] = None,
+  ) -> type[HttpServerHandler]:
+    """
+    Return a subclass with the app's functions stored as class attributes, so requests
+    call them directly instead of looking them up on the server each time.
+    A subclass (not this class) so several servers in one process don't share functions.
+    """
+    if not callable(handler_func):
+      raise TypeError(f"handler must be callable, got {handler_func!r}")
+    attrs = {"_handler_func": staticmethod(handler_func)}
+    if error_handler_func is not None:
+      attrs["_error_handler_func"] = staticmethod(error_handler_func)
+    return type(cls.__name__, (cls,), attrs)
+
+  def handle(self):
+    """Handle requests on this connection until it closes or stays idle for keep_alive_timeout."""
+    self.close_connection = True
+    self.handle_one_request()
+    server = self.server
+    while not self.close_connection:
+      # An idle connection holds a worker thread: the server declines (or later wakes us)
+      # when other connections are waiting for one
+      if not server.park_idle(self.connection):
+        break
+      self.connection.settimeout(self.keep_alive_timeout)
+      try:
+        if not self.rfile.peek(1):
+          break  # client closed the connection, or the server needs the worker
+      except (TimeoutError, ConnectionResetError):
+        break
+      finally:
+        server.unpark_idle(self.connection)
+      self.connection.settimeout(self.timeout)
+      self.handle_one_request()
+
   def handle_one_request(self):
     # Set response helper before parsing so it's available to app handlers.
     # (Cannot set in __init__: base class __init__ calls handle() and never returns to our __init__.)
     self.response = ResponseHelper(self)
+    # Drop the previous request's lazily parsed path/query (keep-alive reuses this instance)
+    self.__dict__.pop("path_no_query", None)
+    self.__dict__.pop("query_params", None)
+    self._framed = False
     try:
-      self.raw_requestline = self.rfile.readline(65537)
-      if len(self.raw_requestline) > 65536:
-        self.requestline = ""
-        self.request_version = ""
-        self.command = ""
-        self.send_error(414, "Request URI Too Long")
-        return
-      if not self.raw_requestline:
-        self.close_connection = True
-        return
-      if not self.parse_request():
-        return
-      # Convert HTTPMessage to Headers object for universal API
-      self.headers = Headers(self.headers)
-      self._set_path_and_query()
-      self.handle_request()
+      if self.parse_request():
+        headers = self.headers
+        if headers.get("content-length", "0") != "0" or headers.has("transfer-encoding"):
+          # The handler may not read all of the request body, which would leave stray bytes
+          # on the connection, so don't reuse it (the response says Connection: close)
+          self.close_connection = True
+        self.handle_request()
+        if not self._framed:
+          # Raw API response without a length: only closing the connection ends its body
+          self.close_connection = True
+      # The whole response (or parse_request's error response) goes out here
       self.wfile.flush()
-    except (BrokenPipeError, ConnectionResetError):
+    except _QUIET:
       self.close_connection = True
     except Exception as e:
       self._handle_error(e)
 
+  def _read_head(self) -> bytes | None:
+    """
+    Read the request head (up to and including the blank line) from rfile.
+    Scans whatever is already buffered instead of reading line by line, and consumes
+    only the head, so a request body stays in rfile for the handler.
+    Returns b"" on EOF, or None if the head is too large (error already sent).
+    """
+    rfile = self.rfile
+    data = rfile.peek()  # buffered bytes, or one recv() if the buffer is empty
+    if not data:
+      return b""
+    m = _HEAD_END.search(data)
+    if m is not None and m.end() <= _MAX_HEAD:
+      # Common case: the whole head arrived in one read; read() consumes it and is the only copy
+      return rfile.read(m.end())
+    # Head split over several reads (or too large): collect it
+    buf = bytearray()
+    while True:
+      start = max(0, len(buf) - 3)  # terminator may straddle two reads
+      buf += data
+      m = _HEAD_END.search(buf, start)
+      if m is not None and m.end() <= _MAX_HEAD:
+        rfile.read(m.end() - (len(buf) - len(data)))
+        return bytes(buf[:m.end()])
+      if m is not None or len(buf) > _MAX_HEAD:
+        self.requestline = ""
+        self.request_version = ""
+        self.command = ""
+        if buf.find(b"\n", 0, _MAX_HEAD) < 0:
+          self.send_error(HTTPStatus.REQUEST_URI_TOO_LONG, "Request URI Too Long")
+        else:
+          self.send_error(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Request header fields too large")
+        return None
+      rfile.read(len(data))
+      data = rfile.peek()
+      if not data:
+        return b""
+
+  def parse_request(self) -> bool:
+    """
+    Read and parse the request line and headers straight into a Headers object.
+    Same checks and results as BaseHTTPRequestHandler.parse_request (version, HTTP/0.9,
+    '//' paths, Connection, Expect), without going through http.client/email parsing.
+    Returns False if the request should not be handled (any error response already sent).
+    """
+    self.command = None  # set in case of error on the first line
+    self.request_version = version = self.default_request_version
+    self.close_connection = True
+    head = self._read_head()
+    if not head:
+      return False
+    lines = head.split(b"\n")
+    self.raw_requestline = lines[0] + b"\n"
+    requestline = str(lines[0], "iso-8859-1").rstrip("\r")
+    self.requestline = requestline
+    words = requestline.split()
+    if len(words) == 0:
+      return False
+
+    if len(words) >= 3:  # Enough to determine protocol version
+      version = words[-1]
+      try:
+        if not version.startswith("HTTP/"):
+          raise ValueError
+        version_number = version.split("/", 1)[1].split(".")
+        if len(version_number) != 2:
+          raise ValueError
+        if any(not component.isdigit() or len(component) > 10 for component in version_number):
+          raise ValueError
+        version_number = int(version_number[0]), int(version_number[1])
+      except (ValueError, IndexError):
+        self.send_error(HTTPStatus.BAD_REQUEST, "Bad request version (%r)" % version)
+        return False
+      if version_number >= (1, 1) and self.protocol_version >= "HTTP/1.1":
+        self.close_connection = False
+      if version_number >= (2, 0):
+        self.send_error(HTTPStatus.HTTP_VERSION_NOT_SUPPORTED, "Invalid HTTP version (%s)" % version[5:])
+        return False
+      self.request_version = version
+
+    if not 2 <= len(words) <= 3:
+      self.send_error(HTTPStatus.BAD_REQUEST, "Bad request syntax (%r)" % requestline)
+      return False
+    command, path = words[:2]
+    if len(words) == 2:
+      self.close_connection = True
+      if command != "GET":
+        self.send_error(HTTPStatus.BAD_REQUEST, "Bad HTTP/0.9 request type (%r)" % command)
+        return False
+    self.command, self.path = command, path
+
+    # Same open-redirect protection as the stdlib (gh-87389): //path -> /path
+    if path.startswith("//"):
+      self.path = "/" + path.lstrip("/")
+
+    headers = Headers()
+    store = headers._headers
+    last = None
+    count = 0
+    for line in lines[1:]:
+      line = line.rstrip(b"\r")
+      if not line:
+        continue
+      if line[0] in b" \t" and last is not None:
+        # Obsolete line folding: continuation of the previous header value
+        store[last] += " " + str(line.strip(b" \t"), "iso-8859-1")
+        continue
+      colon = line.find(b":")
+      if colon <= 0:
+        self.send_error(HTTPStatus.BAD_REQUEST, "Bad header line (%r)" % line)
+        return False
+      count += 1
+      if count > _MAX_HEADERS:
+        self.send_error(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Too many headers")
+        return False
+      last = _canon(str(line[:colon], "iso-8859-1"))
+      headers[last] = str(line[colon + 1:].strip(b" \t"), "iso-8859-1")
+    self.headers = headers
+
+    conntype = headers.get("connection").lower()
+    if conntype == "close":
+      self.close_connection = True
+    elif conntype == "keep-alive" and self.protocol_version >= "HTTP/1.1":
+      self.close_connection = False
+    # Examine the headers and look for an Expect directive
+    if (headers.get("expect").lower() == "100-continue" and
+        self.protocol_version >= "HTTP/1.1" and
+        self.request_version >= "HTTP/1.1"):
+      if not self.handle_expect_100():
+        return False
+      self.wfile.flush()  # the client waits for "100 Continue" before sending the body
+    return True
+
   def _set_path_and_query(self) -> None:
     """Set .path_no_query and .query_params from .path (full path with optional query)."""
-    path_only, query_params = parse_path_and_query(self.path)
+    path_only, query_params = parse_path_and_query(self.__dict__.get("path", "/"))
     self.path_no_query = path_only
     self.query_params = query_params
 
+  def __getattr__(self, name: str):
+    # Only called for missing attributes: parse the query string on first access to
+    # .path_no_query/.query_params, so handlers that never look at them skip parse_qs.
+    # Both are then plain instance attributes, so later lookups don't come back here.
+    if name in ("path_no_query", "query_params"):
+      self._set_path_and_query()
+      return self.__dict__[name]
+    raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
   def _handle_error(self, exc: Exception) -> None:
     """Call error_handler(request, error) or default; log traceback server-side."""
-    # Client disconnected - nothing to do
-    if isinstance(exc, (BrokenPipeError, ConnectionResetError)):
+    # Client disconnected - nothing to do (checked before any logging/formatting)
+    if isinstance(exc, _CLIENT_GONE):
       self.close_connection = True
       return
-    if not hasattr(self, "path_no_query"):
-      path_only, query_params = parse_path_and_query(getattr(self, "path", "/"))
-      self.path_no_query = path_only
-      self.query_params = query_params
+    # Part of a response may already be written; don't reuse the connection after the error page
+    self.close_connection = True
     error = HttpServerError.from_exception(exc, debug=False)
     self.log_error("Request error: %r", exc)
-    error_handler = getattr(self.server, "error_handler_func", None)
-    if callable(error_handler):
-      try:
-        error_handler(self, error)
-        self.wfile.flush()
-      except (BrokenPipeError, ConnectionResetError):
-        # Client disconnected during error response
-        self.close_connection = True
-      except Exception:
-        self.log_error("Error in error_handler: %s", traceback.format_exc())
-        self.close_connection = True
-    else:
-      try:
-        default_error_handler(self, error)
-        self.wfile.flush()
-      except (BrokenPipeError, ConnectionResetError):
-        self.close_connection = True
+    try:
+      self._error_handler_func(self, error)
+      self.wfile.flush()
+    except _QUIET:
+      # Client disconnected during error response
+      self.close_connection = True
+    except Exception:
+      self.log_error("Error in error_handler: %s", traceback.format_exc())
+      self.close_connection = True
+
+  def send_header(self, keyword: str, value: str) -> None:
+    """Same as the stdlib's; also notes whether the response body is framed."""
+    name = keyword.lower()
+    if name == "content-length" or (name == "transfer-encoding" and "chunked" in value.lower()):
+      self._framed = True
+    super().send_header(keyword, value)
 
   def handle_request(self):
     """Call the app's handler function(request). Request is self (this handler instance)."""
-    handler_func = getattr(self.server, "handler_func", None)
-    if not callable(handler_func):
-      self.send_error(501, "No handler configured")
-      return
     try:
-      handler_func(self)
+      self._handler_func(self)
     except Exception as e:
       self._handle_error(e)
@@ -1,16 +1,32 @@
 """Web-standard-like Headers class for normalizing HTTP headers."""
 from __future__ import annotations
-from typing import Union, Iterator
+from typing import Iterable, Union, Iterator
 from http.client import HTTPMessage
 
 
-# Headers to skip when proxying (hop-by-hop + problematic headers)
+# Headers to skip when proxying (hop-by-hop + problematic headers), in either direction.
+# The one shared definition: Headers, proxy_headers, fetch and streamProxy all filter with it.
 HOP_BY_HOP = frozenset([
   "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
   "te", "trailers", "transfer-encoding", "upgrade", "host",
   "accept-encoding", "content-length"  # avoid compressed/chunked issues
 ])
 
+# Lowercased header names, so repeat names (Content-Type, User-Agent, ...) skip .lower().
+# Bounded so clients sending random header names can't grow it forever.
+_CANON_CACHE: dict[str, str] = {}
+_CANON_MAX = 1024
+
+
+def _canon(name: str) -> str:
+  """Lowercase a header name, memoized in _CANON_CACHE."""
+  c = _CANON_CACHE.get(name)
+  if c is None:
+    c = name.lower()
+    if len(_CANON_CACHE) < _CANON_MAX:
+      _CANON_CACHE[name] = c
+  return c
+
 
 class Headers:
   """
@@ -31,42 +47,51 @@ class Headers:
     for key, value in headers:
       print(f"{key}: {value}")
   """
+
+  # No per-instance __dict__: one of these is created per request
+  __slots__ = ("_headers", "_dict_cache")
   
   def __init__(self, init: Union[HTTPMessage, dict, list, "Headers", None] = None) -> None:
     self._headers: dict[str, str] = {}
+    self._dict_cache: dict[str, str] | None = None
     
     if init is None:
       return
     
-    if isinstance(init, Headers):
+    # Exact type() checks first for the common inputs; subclasses fall through to isinstance.
+    t = type(init)
+    if t is dict:
+      self._headers = {_canon(k): str(v) for k, v in init.items()}
+    elif t is Headers or isinstance(init, Headers):
       self._headers = init._headers.copy()
     elif isinstance(init, HTTPMessage):
-      for key, value in init.items():
-        self._headers[key.lower()] = value
+      self._headers = {_canon(k): v for k, v in init.items()}
     elif isinstance(init, dict):
-      for key, value in init.items():
-        self._headers[key.lower()] = str(value)
+      self._headers = {_canon(k): str(v) for k, v in init.items()}
     elif isinstance(init, list):
+      headers = self._headers
       for key, value in init:
-        self._headers[key.lower()] = str(value)
+        headers[_canon(key)] = str(value)
   
   def get(self, name: str, default: str = "") -> str:
     """Get header value (case-insensitive)."""
-    return self._headers.get(name.lower(), default)
+    return self._headers.get(_canon(name), default)
   
   def set(self, name: str, value: str) -> Headers:
     """Set header value. Returns self for chaining."""
-    self._headers[name.lower()] = value
+    self._headers[_canon(name)] = value
+    self._dict_cache = None
     return self
   
   def delete(self, name: str) -> Headers:
     """Delete a header. Returns self for chaining."""
-    self._headers.pop(name.lower(), None)
+    self._headers.pop(_canon(name), None)
+    self._dict_cache = None
     return self
   
   def has(self, name: str) -> bool:
     """Check if header exists."""
-    return name.lower() in self._headers
+    return _canon(name) in self._headers
   
   def keys(self) -> Iterator[str]:
     """Iterate over header names."""
@@ -81,28 +106,39 @@ class Headers:
     return iter(self._headers.items())
   
   def to_dict(self) -> dict[str, str]:
-    """Convert to plain dict."""
-    return self._headers.copy()
+    """
+    Convert to plain dict. The dict is built once and returned again until the headers
+    change, so repeated calls in a request are free; copy it before modifying it.
+    """
+    if self._dict_cache is None:
+      self._dict_cache = self._headers.copy()
+    return self._dict_cache
   
   def to_proxy_dict(self) -> dict[str, str]:
     """Convert to dict, filtering out hop-by-hop headers (for proxying)."""
-    return {k: v for k, v in self._headers.items() if k not in HOP_BY_HOP}
+    # Copy in C, then delete only the hop-by-hop names actually present (keeps header order)
+    result = self._headers.copy()
+    for key in result.keys() & HOP_BY_HOP:
+      del result[key]
+    return result
   
   def copy(self) -> Headers:
     """Create a copy of this Headers object."""
     return Headers(self)
   
   def __getitem__(self, name: str) -> str:
-    return self._headers.get(name.lower(), "")
+    return self._headers.get(_canon(name), "")
   
   def __setitem__(self, name: str, value: str) -> None:
-    self._headers[name.lower()] = value
+    self._headers[_canon(name)] = value
+    self._dict_cache = None
   
   def __delitem__(self, name: str) -> None:
-    self._headers.pop(name.lower(), None)
+    self._headers.pop(_canon(name), None)
+    self._dict_cache = None
   
   def __contains__(self, name: str) -> bool:
-    return name.lower() in self._headers
+    return _canon(name) in self._headers
   
   def __iter__(self) -> Iterator[tuple[str, str]]:
     return iter(self._headers.items())
@@ -126,12 +162,20 @@ def proxy_headers(headers: Union[Headers, HTTPMessage, dict, None]) -> Headers:
     h.set("referer", "https://example.com")  # override
     request.response.stream(url, headers=h)
   """
-  result = Headers()
   if headers is None:
-    return result
+    return Headers()
   
-  source = Headers(headers) if not isinstance(headers, Headers) else headers
-  for key, value in source:
-    if key not in HOP_BY_HOP:
-      result.set(key, value)
+  result = headers.copy() if isinstance(headers, Headers) else Headers(headers)
+  store = result._headers
+  for key in store.keys() & HOP_BY_HOP:
+    del store[key]
   return result
+
+
+def filter_hop(items: Iterable[tuple[str, str]]) -> list[tuple[str, str]]:
+  """
+  (name, value) pairs without hop-by-hop headers, e.g. from an upstream response's getheaders().
+  Names keep their original case and repeated headers (Set-Cookie) are all kept.
+  """
+  canon, hop = _canon, HOP_BY_HOP  # locals: cheaper than global lookups inside the loop
+  return [(k, v) for k, v in items if canon(k) not in hop]
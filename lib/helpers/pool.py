@@ -0,0 +1,137 @@
+"""Keep-alive connection pool for outgoing requests (fetch, streamProxy)."""
+from __future__ import annotations
+import threading
+from http.client import HTTPConnection, HTTPResponse, HTTPSConnection, InvalidURL
+from typing import Optional
+from urllib.parse import urljoin, urlsplit
+
+# Idle connections per (scheme, host, port), so repeat requests to the same upstream
+# skip the TCP (and TLS) handshake. Bounded per host and in number of hosts.
+_POOL: dict[tuple[str, str, int], list[HTTPConnection]] = {}
+_POOL_LOCK = threading.Lock()
+_POOL_MAX_HOSTS = 32
+_POOL_MAX_PER_HOST = 16
+
+# Same redirect rules as urllib.request (which fetch used before the pool)
+_MAX_REDIRECTS = 10
+_REDIRECT_CODES = frozenset([301, 302, 303, 307, 308])
+
+# Errors on a reused connection that mean the upstream closed it while idle
+# (http.client.RemoteDisconnected is a ConnectionResetError)
+_STALE_ERRORS = (ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+
+
+def _pool_key(conn: HTTPConnection) -> tuple[str, str, int]:
+  scheme = "https" if isinstance(conn, HTTPSConnection) else "http"
+  return scheme, conn.host, conn.port
+
+
+def _get_conn(scheme: str, host: str, port: Optional[int], timeout: float) -> tuple[HTTPConnection, bool]:
+  """Return (connection, reused). Reuses an idle pooled connection when there is one."""
+  if scheme == "https":
+    conn_class = HTTPSConnection
+    port = port or 443
+  elif scheme == "http":
+    conn_class = HTTPConnection
+    port = port or 80
+  else:
+    raise InvalidURL(f"unknown url type: {scheme!r}")
+  with _POOL_LOCK:
+    idle = _POOL.get((scheme, host, port))
+    conn = idle.pop() if idle else None
+  if conn is not None:
+    conn.timeout = timeout
+    if conn.sock is not None:
+      conn.sock.settimeout(timeout)
+    return conn, True
+  return conn_class(host, port, timeout=timeout), False
+
+
+def release(conn: HTTPConnection, resp: HTTPResponse) -> None:
+  """
+  Give a connection back to the pool once its response has been fully read.
+  Connections the upstream wants closed (or with unread body) are closed instead.
+  """
+  if resp.will_close or not resp.isclosed():
+    conn.close()
+    return
+  key = _pool_key(conn)
+  with _POOL_LOCK:
+    idle = _POOL.get(key)
+    if idle is None and len(_POOL) < _POOL_MAX_HOSTS:
+      idle = _POOL[key] = []
+    if idle is not None and len(idle) < _POOL_MAX_PER_HOST:
+      idle.append(conn)
+      return
+  conn.close()
+
+
+def _send(
+  scheme: str,
+  host: str,
+  port: Optional[int],
+  target: str,
+  method: str,
+  headers: dict[str, str],
+  body: Optional[bytes],
+  timeout: float,
+) -> tuple[HTTPConnection, HTTPResponse]:
+  """Send one request. A pooled connection that turned out stale is dropped and the request resent."""
+  while True:
+    conn, reused = _get_conn(scheme, host, port, timeout)
+    try:
+      conn.request(method, target, body=body, headers=headers)
+      return conn, conn.getresponse()
+    except _STALE_ERRORS:
+      conn.close()
+      if not reused:
+        raise
+    except BaseException:
+      conn.close()
+      raise
+
+
+def open_url(
+  url: str,
+  method: str = "GET",
+  headers: Optional[dict[str, str]] = None,
+  body: Optional[bytes] = None,
+  timeout: float = 30,
+) -> tuple[HTTPConnection, HTTPResponse]:
+  """
+  Send a request over a pooled keep-alive connection and return (connection, response).
+  Follows redirects like urlopen. Status codes are never raised; 4xx/5xx come back as responses.
+  Read the response to the end, then call release(conn, resp) to return the connection.
+
+  Raises OSError (including TimeoutError) or http.client.HTTPException on connection failures.
+  """
+  req_headers = dict(headers) if headers else {}
+  # Default User-Agent only if the caller sent none, in any casing (proxied headers are lowercase)
+  if not any(k.lower() == "user-agent" for k in req_headers):
+    req_headers["User-Agent"] = "py-http"
+  for _ in range(_MAX_REDIRECTS + 1):
+    parts = urlsplit(url)
+    if not parts.hostname:
+      raise InvalidURL(f"no host given: {url!r}")
+    target = parts.path or "/"
+    if parts.query:
+      target += "?" + parts.query
+    conn, resp = _send(parts.scheme, parts.hostname, parts.port, target, method, req_headers, body, timeout)
+
+    location = resp.getheader("Location")
+    redirect_ok = (
+      resp.status in _REDIRECT_CODES and method in ("GET", "HEAD")
+      or resp.status in (301, 302, 303) and method == "POST"
+    )
+    if location is None or not redirect_ok:
+      return conn, resp
+
+    # Drain and reuse the connection, then follow the redirect (POST becomes GET, body dropped)
+    resp.read()
+    release(conn, resp)
+    url = urljoin(url, location)
+    if method != "HEAD":
+      method = "GET"
+    body = None
+    req_headers = {k: v for k, v in req_headers.items() if k.lower() not in ("content-length", "content-type")}
+  return conn, resp
@@ -20,6 +20,10 @@ def parse_path_and_query(full_path: str) -> tuple[str, QueryParams]:
   if "?" not in full_path:
     return full_path, {}
   path_part, _, query_string = full_path.partition("?")
+  # Fast path for a single plain pair (?id=1): nothing to split, unquote or collect into lists
+  if "&" not in query_string and "[]" not in query_string and "%" not in query_string and "+" not in query_string:
+    key, sep, value = query_string.partition("=")
+    return path_part, ({key: value} if sep or key else {})
   raw = parse_qs(query_string, keep_blank_values=True)
   query_params: QueryParams = {}
   for key, values in raw.items():
@@ -1,8 +1,12 @@
 from __future__ import annotations
+import logging
 import os
 import signal
+import socket
+import sys
 import threading
 import time
+import traceback
 from collections.abc import Callable
 # Thread pool: handle multiple requests concurrently (one slow request doesn't block others).
 from concurrent.futures import ThreadPoolExecutor
@@ -15,6 +19,8 @@ from lib.handler import HttpServerHandler
 if TYPE_CHECKING:
   from lib.error import HttpServerError
 
+logger = logging.getLogger(__name__)
+
 # Reusable type: handler function(request) -> None
 HandlerFunc = Callable[[HttpServerHandler], None]
 
@@ -28,15 +34,24 @@ class ThreadPooledHTTPServer(HTTPServer):
   # Allow binding to a recently-used port (e.g., after restart)
   allow_reuse_address = True
 
-  def __init__(self, server_address, RequestHandlerClass, max_workers: int = 1):
+  def __init__(self, server_address, RequestHandlerClass, max_workers: int = 1, reuse_port: bool = False):
     """
     server_address: Address to bind.
     RequestHandlerClass: Class to handle requests.
     max_workers: Max concurrent handler threads (default 1 = single-threaded).
+    reuse_port: Set SO_REUSEPORT so several worker processes can bind the same port.
     """
     # Initialize executor to None first so server_close() won't fail
     # if super().__init__() raises an exception (e.g., "Address already in use")
     self._executor: Optional[ThreadPoolExecutor] = None
+    # Connections submitted and not finished (running or queued), and the sockets of idle
+    # keep-alive connections parked in a worker waiting for their next request
+    self._max_workers = max_workers
+    self._active = 0
+    self._idle: set[socket.socket] = set()
+    self._idle_lock = threading.Lock()
+    # Read by TCPServer.server_bind(); the kernel then spreads incoming connections across processes
+    self.allow_reuse_port = reuse_port
     super().__init__(server_address, RequestHandlerClass)
 
     # Executor for handling requests in threads (Handlers Queue for execution)
@@ -47,14 +62,45 @@ class ThreadPooledHTTPServer(HTTPServer):
     # The executor will handle the request in a thread from the pool, which is already started
     # The thread will be closed when the request is finished (when the handler function returns)
     if self._executor is not None:
+      with self._idle_lock:
+        self._active += 1
+        if self._active > self._max_workers and self._idle:
+          # No free worker: end an idle keep-alive connection so this one doesn't wait for it
+          # (its blocked read returns EOF and the worker moves on)
+          try:
+            self._idle.pop().shutdown(socket.SHUT_RD)
+          except OSError:
+            pass
       self._executor.submit(self._process_request_thread, request, client_address)
 
+  def park_idle(self, sock: socket.socket) -> bool:
+    """
+    Called by a handler before waiting for the next request on a keep-alive connection.
+    Returns False (close it instead) if connections are already waiting for a worker.
+    """
+    with self._idle_lock:
+      if self._active > self._max_workers:
+        return False
+      self._idle.add(sock)
+      return True
+
+  def unpark_idle(self, sock: socket.socket) -> None:
+    """Called once the parked connection has a request (or closed)."""
+    with self._idle_lock:
+      self._idle.discard(sock)
+
   def _process_request_thread(self, request, client_address):
-    # One process (PID), multiple threads (name + id) share the same PID
-    t = threading.current_thread()
-    print(f"Processing request in thread {t.name} (id {t.ident}) in process PID {os.getpid()}")
-    self.finish_request(request, client_address)
-    self.shutdown_request(request)
+    # One process (PID), multiple threads (name + id) share the same PID.
+    # Debug-only: a print per request would take the stdout lock and format on the hot path.
+    if logger.isEnabledFor(logging.DEBUG):
+      t = threading.current_thread()
+      logger.debug("Processing request in thread %s (id %s) in process PID %s", t.name, t.ident, os.getpid())
+    try:
+      self.finish_request(request, client_address)
+      self.shutdown_request(request)
+    finally:
+      with self._idle_lock:
+        self._active -= 1
 
   def server_close(self):
     """Close the listening socket, then wait for all handler threads to finish and shut down the pool."""
@@ -72,6 +118,7 @@ class HttpServer():
   error_handler: Optional[HandlerFunc] = None
   server: Optional[ThreadPooledHTTPServer] = None
   max_threads: int = 1
+  workers: int = 1
 
   def __init__(
     self,
@@ -79,22 +126,66 @@ class HttpServer():
     handler: HandlerFunc,
     error_handler: Optional[ErrorHandlerFunc] = None,
     max_threads: int = 1,
+    workers: int = 1,
   ):
     """
     port: Port to bind.
     handler: Function(request) that handles every request.
     error_handler: Optional function(request, error) for any uncaught error (runtime, 5xx, etc.).
     max_threads: Max concurrent handler threads (default 1 = single-threaded).
+    workers: Number of server processes (default 1). With more than one, each process binds the
+      port with SO_REUSEPORT and runs its own thread pool, so handlers run in parallel past the GIL.
+      Needs os.fork and SO_REUSEPORT (Linux, BSD, macOS).
     """
     self.port = port
     self.handler = handler
     self.error_handler = error_handler
     self.max_threads = max_threads
+    self.workers = workers
     self.server = None
+    self._is_worker = False
+
+  def _start_workers(self):
+    """Fork self.workers processes that each serve the port; wait for them to exit."""
+    sys.stdout.flush()  # don't duplicate buffered output into the children
+    pids = []
+    for _ in range(self.workers):
+      pid = os.fork()
+      if pid == 0:
+        self._is_worker = True
+        exit_code = 0
+        try:
+          self.start()
+        except BaseException:
+          traceback.print_exc()
+          exit_code = 1
+        finally:
+          os._exit(exit_code)
+      pids.append(pid)
+
+    def shutdown_handler(signum, frame):
+      """Forward SIGINT/SIGTERM to the workers; each shuts down gracefully."""
+      for pid in pids:
+        try:
+          os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+          pass
+
+    signal.signal(signal.SIGINT, shutdown_handler)
+    signal.signal(signal.SIGTERM, shutdown_handler)
+    print(f"Started {len(pids)} worker processes on port {self.port}")
+    for pid in pids:
+      os.waitpid(pid, 0)
 
   def start(self, _retries: int = 0):
     max_retries = 2
 
+    if self.workers > 1 and not self._is_worker:
+      if hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT"):
+        self._start_workers()
+        return
+      print("workers > 1 needs os.fork and SO_REUSEPORT; running a single process")
+
     def shutdown_handler(signum, frame):
       """Handle SIGINT/SIGTERM by gracefully shutting down the server."""
       print("\nShutting down server...")
@@ -102,18 +193,19 @@ class HttpServer():
         # shutdown() must be called from a different thread
         threading.Thread(target=self.server.shutdown).start()
 
+    # Raises TypeError up front if handler isn't callable
+    handler_class = HttpServerHandler.bind(self.handler, self.error_handler)
+
     try:
       self.server = ThreadPooledHTTPServer(
-        ("", self.port), HttpServerHandler, max_workers=self.max_threads
+        ("", self.port), handler_class, max_workers=self.max_threads, reuse_port=self._is_worker
       )
-      self.server.handler_func = self.handler
-      self.server.error_handler_func = self.error_handler
 
       # Register signal handlers for graceful shutdown (hot reload friendly)
       signal.signal(signal.SIGINT, shutdown_handler)
       signal.signal(signal.SIGTERM, shutdown_handler)
 
-      print(f"Serving at port {self.port}")
+      print(f"Serving at port {self.port}" + (f" (worker PID {os.getpid()})" if self._is_worker else ""))
       self.server.serve_forever(poll_interval=0.1)  # Faster poll for quicker shutdown
     except OSError as e:
       if e.errno == 48 and _retries < max_retries:  # Address already in use
@@ -2,16 +2,208 @@
 from __future__ import annotations
 import mimetypes
 import os
+import queue
+import re
+import stat
+import threading
 import time
+from functools import lru_cache
+from email.utils import formatdate
 from json import dumps
 from typing import TYPE_CHECKING, Literal, Optional, Union
-from urllib.request import Request, urlopen
-from urllib.error import HTTPError, URLError
-from lib.headers import Headers, HOP_BY_HOP
+from http.client import HTTPConnection, HTTPException, HTTPMessage, HTTPResponse
+from lib.headers import Headers, _canon, filter_hop
+from lib.helpers.pool import open_url, release
 
 if TYPE_CHECKING:
   from lib.handler import HttpServerHandler
 
+# Optional: orjson is several times faster than json.dumps and returns bytes directly
+try:
+  import orjson
+
+  def _json_dumps(obj: Union[dict, list]) -> bytes:
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)  # int keys -> str, like json.dumps
+except ImportError:
+  def _json_dumps(obj: Union[dict, list]) -> bytes:
+    return dumps(obj).encode()
+
+# Content-Type header lines for the fixed-type helpers, encoded once at import
+_CT_HTML = b"Content-Type: text/html; charset=utf-8\r\n"
+_CT_JSON = b"Content-Type: application/json; charset=utf-8\r\n"
+_CT_TEXT = b"Content-Type: text/plain; charset=utf-8\r\n"
+_CT_PLAIN = b"Content-Type: text/plain\r\n"
+_CL_ZERO = b"Content-Length: 0\r\n"
+_ACCEPT_RANGES = b"Accept-Ranges: bytes\r\n"
+_KEEP_ALIVE = b"Connection: keep-alive\r\n"
+_CONN_CLOSE = b"Connection: close\r\n"
+_CHUNKED = b"Transfer-Encoding: chunked\r\n"
+
+# Room before each chunk in streamProxy's buffer for its size line (up to 8 hex digits + CRLF)
+_CHUNK_PAD = 10
+# Buffers streamProxy's reader thread can fill ahead of the client
+_PROXY_BUFFERS = 4
+
+# Statuses that never have a body, so they get no Content-Length either (RFC 9110 8.6)
+_NO_BODY_STATUSES = frozenset((*range(100, 200), 204, 304))
+
+# Fixed error responses as (header lines, body), built once instead of per call
+_NOT_FOUND = (_CT_PLAIN + b"Content-Length: 14\r\n", b"File not found")
+_NOT_A_FILE = (_CT_PLAIN + b"Content-Length: 18\r\n", b"Path is not a file")
+_GATEWAY_TIMEOUT = (_CT_PLAIN + b"Content-Length: 15\r\n", b"Gateway Timeout")
+
+# (handler class, status) -> b"HTTP/1.1 200 OK\r\nServer: ...\r\n". Per class because
+# protocol_version and the Server string are class attributes an app may override.
+_status_lines: dict[tuple[type, int], bytes] = {}
+
+# Bodies at least this large are sent with the head in one gathered sendmsg() instead of
+# being copied onto the end of the head first
+_GATHER_MIN = 16384
+
+# (second, b"Date: ...\r\n") - formatdate runs once per wall-clock second, not per response
+_date_cache: tuple[int, bytes] = (0, b"")
+
+
+def _date_header() -> bytes:
+  """Date header line for the current second."""
+  global _date_cache
+  now = int(time.time())
+  if _date_cache[0] != now:
+    _date_cache = (now, f"Date: {formatdate(now, usegmt=True)}\r\n".encode("latin-1"))
+  return _date_cache[1]
+
+
+# Extension -> MIME type for common files, so file() skips mimetypes (and loading its
+# database) for them. Other extensions are looked up once and added, up to _EXT_MIME_MAX.
+_EXT_MIME: dict[str, str] = {
+  ".html": "text/html", ".htm": "text/html", ".css": "text/css",
+  ".js": "text/javascript", ".mjs": "text/javascript", ".json": "application/json",
+  ".txt": "text/plain", ".csv": "text/csv", ".xml": "application/xml", ".md": "text/markdown",
+  ".svg": "image/svg+xml", ".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg",
+  ".gif": "image/gif", ".webp": "image/webp", ".avif": "image/avif",
+  ".ico": "image/vnd.microsoft.icon", ".mp4": "video/mp4", ".webm": "video/webm",
+  ".mov": "video/quicktime", ".mp3": "audio/mpeg", ".wav": "audio/x-wav", ".ogg": "audio/ogg",
+  ".m4a": "audio/mp4", ".pdf": "application/pdf", ".zip": "application/zip",
+  ".wasm": "application/wasm", ".woff": "font/woff", ".woff2": "font/woff2", ".ttf": "font/ttf",
+}
+_EXT_MIME_MAX = 512
+
+
+def _guess_content_type(path: str) -> str:
+  """MIME type from the file extension (application/octet-stream if unknown)."""
+  ext = os.path.splitext(path)[1].lower()
+  content_type = _EXT_MIME.get(ext)
+  if content_type is None:
+    content_type = mimetypes.guess_type("f" + ext)[0] or "application/octet-stream"
+    if len(_EXT_MIME) < _EXT_MIME_MAX:
+      _EXT_MIME[ext] = content_type
+  return content_type
+
+
+# Single byte range: bytes=500-999, bytes=500- or bytes=-500. Up to 19 digits (beyond any
+# file size), so int() never sees a number over its digit limit; longer ones are ignored.
+_RANGE_RE = re.compile(r"bytes=([0-9]{0,19})-([0-9]{0,19})")
+
+# Buffer mode keeps files up to this size in memory, so hot small assets skip disk reads.
+# Keyed on mtime and size as well, so an edited file is read again. At most 64 MiB in total.
+_SMALL_FILE_MAX = 1 << 20
+
+
+@lru_cache(maxsize=64)
+def _load_small_file(path: str, mtime_ns: int, size: int) -> bytes:
+  with open(path, "rb") as f:
+    return f.read()
+
+
+def _send_gathered(r: HttpServerHandler, head: bytes, body: bytes) -> bool:
+  """
+  Send head and body with one sendmsg() (writev) on the socket, without joining them.
+  Returns False, having sent nothing, where the socket doesn't support it (TLS, Windows).
+  """
+  sock = r.connection
+  r.wfile.flush()  # anything already buffered in wfile must go out first
+  try:
+    sent = sock.sendmsg([head, body])
+  except (AttributeError, NotImplementedError):
+    return False
+  # A large body may be sent only in part; finish (from where sendmsg stopped) with sendall
+  if sent < len(head):
+    sock.sendall(head[sent:])
+    sock.sendall(body)
+  elif sent < len(head) + len(body):
+    with memoryview(body) as mv:
+      sock.sendall(mv[sent - len(head):])
+  return True
+
+
+# Response body encoders: body -> (bytes, Content-Type or None)
+def _encode_json(body: Union[dict, list]) -> tuple[bytes, Optional[str]]:
+  return _json_dumps(body), "application/json; charset=utf-8"
+
+
+def _encode_text(body: str) -> tuple[bytes, Optional[str]]:
+  return body.encode(), "text/plain; charset=utf-8"
+
+
+def _encode_raw(body: bytes) -> tuple[bytes, Optional[str]]:
+  return body, None
+
+
+# Exact body type -> encoder: one dict lookup instead of an isinstance chain per Response
+_BODY_ENCODERS = {dict: _encode_json, list: _encode_json, str: _encode_text, bytes: _encode_raw}
+
+
+def _body_encoder(body: object):
+  """Encoder for types not in _BODY_ENCODERS (subclasses such as OrderedDict, bytearray)."""
+  if isinstance(body, (dict, list)):
+    return _encode_json
+  if isinstance(body, str):
+    return _encode_text
+  return _encode_raw
+
+
+def _write_chunk(r: HttpServerHandler, mv: memoryview, n: int, chunked: bool) -> None:
+  """Write the n data bytes at mv[_CHUNK_PAD:] to the client, framed as a chunk if chunked."""
+  if chunked:
+    size_line = b"%x\r\n" % n
+    start = _CHUNK_PAD - len(size_line)
+    mv[start:_CHUNK_PAD] = size_line
+    mv[_CHUNK_PAD + n:_CHUNK_PAD + n + 2] = b"\r\n"
+    r.wfile.write(mv[start:_CHUNK_PAD + n + 2])
+  else:
+    r.wfile.write(mv[_CHUNK_PAD:_CHUNK_PAD + n])
+  r.wfile.flush()  # pass each chunk on as it arrives, not once wfile's buffer fills
+
+
+def _read_upstream(
+  conn: HTTPConnection,
+  upstream: HTTPResponse,
+  chunk_size: int,
+  free: queue.SimpleQueue,
+  filled: queue.SimpleQueue,
+  stop: threading.Event,
+) -> None:
+  """
+  streamProxy's reader thread: fill buffers from free with the upstream body and pass
+  (buffer, length) to filled, then None at the end. A read error is passed on instead.
+  Owns the upstream connection: releases it to the pool on EOF, closes it otherwise.
+  """
+  try:
+    while True:
+      mv = free.get()
+      if mv is None or stop.is_set():
+        conn.close()
+        return
+      n = upstream.readinto(mv[_CHUNK_PAD:_CHUNK_PAD + chunk_size])
+      if not n:
+        release(conn, upstream)
+        filled.put(None)
+        return
+      filled.put((mv, n))
+  except BaseException as e:
+    conn.close()
+    filled.put(e)
+
 
 class Response:
   """
@@ -25,6 +217,9 @@ class Response:
     Response(b"raw bytes", 200)         # raw bytes, no Content-Type
     Response({"data": 1}, headers={"X-Custom": "value"})
   """
+
+  # No per-instance __dict__: one of these is created per response
+  __slots__ = ("status", "headers", "body")
   
   def __init__(
     self,
@@ -36,59 +231,105 @@ class Response:
     self.headers: dict[str, str] = headers.copy() if headers else {}
     
     # Infer Content-Type from body type
-    if isinstance(body, (dict, list)):
-      self.body = dumps(body).encode("utf-8")
-      if "Content-Type" not in self.headers:
-        self.headers["Content-Type"] = "application/json; charset=utf-8"
-    elif isinstance(body, str):
-      self.body = body.encode("utf-8")
-      if "Content-Type" not in self.headers:
-        self.headers["Content-Type"] = "text/plain; charset=utf-8"
-    else:
-      self.body = body
+    encode = _BODY_ENCODERS.get(type(body)) or _body_encoder(body)
+    self.body, content_type = encode(body)
+    if content_type is not None and "Content-Type" not in self.headers:
+      self.headers["Content-Type"] = content_type
   
   def header(self, key: str, value: str) -> Response:
     """Set a header. Returns self for chaining."""
     self.headers[key] = value
     return self
 
+  def encode_headers(self) -> tuple[bytes, bool]:
+    """
+    All headers as "Name: value" + CRLF lines in one bytes object, ready to follow the status line,
+    and whether they ask for "Connection: close".
+    Adds Content-Length from the body when the headers don't set it (needed for keep-alive),
+    except for 1xx, 204 and 304, which have no body.
+    Leaves out Connection (any casing): the server sends its own from whether it keeps the connection.
+    """
+    lines = []
+    has_length = False
+    close = False
+    for k, v in self.headers.items():
+      name = _canon(k)
+      if name == "connection":
+        close = close or v.lower() == "close"
+        continue
+      lines.append(f"{k}: {v}\r\n")
+      if name == "content-length":
+        has_length = True
+    if not has_length and self.status not in _NO_BODY_STATUSES:
+      lines.append(f"Content-Length: {len(self.body)}\r\n")
+    return "".join(lines).encode("latin-1"), close
+
 
 class ResponseHelper:
   """Bound to the request so handlers can use request.response.html(), .json(), etc."""
 
+  __slots__ = ("_request",)
+
   def __init__(self, request: HttpServerHandler) -> None:
     self._request = request
 
+  def _send_raw(self, status: int, header_lines: bytes, body: bytes = b"") -> None:
+    """
+    Send status line, Server, Date, pre-encoded header_lines and body with one wfile.write.
+    Same output as send_response() + send_header() + end_headers() + write(), without
+    per-header encoding or a separate write for the body.
+    """
+    r = self._request
+    r.log_request(status)
+    # Every caller passes Content-Length or chunked framing (or sets close_connection)
+    r._framed = True
+    if r.request_version == "HTTP/0.9":
+      # HTTP/0.9 responses have no status line or headers
+      if body:
+        r.wfile.write(body)
+      return
+    key = (r.__class__, status)
+    status_line = _status_lines.get(key)
+    if status_line is None:
+      phrase = r.responses[status][0] if status in r.responses else ""
+      status_line = _status_lines[key] = (
+        f"{r.protocol_version} {status} {phrase}\r\nServer: {r.version_string()}\r\n".encode("latin-1")
+      )
+    if r.close_connection:
+      # HTTP/1.1 clients assume keep-alive unless told otherwise (HTTP/1.0 assumes close)
+      if r.request_version != "HTTP/1.0":
+        header_lines += _CONN_CLOSE
+    elif r.request_version == "HTTP/1.0":
+      # HTTP/1.0 clients only reuse the connection if the response says so
+      header_lines += _KEEP_ALIVE
+    if r.command == "HEAD":
+      body = b""  # same headers as GET (Content-Length included), no body
+    head = status_line + _date_header() + header_lines + b"\r\n"
+    if len(body) >= _GATHER_MIN and _send_gathered(r, head, body):
+      return
+    # Only the Date line changes between calls, so the whole response is one concatenation
+    r.wfile.write(head + body if body else head)
+
   def html(self, body: Union[str, bytes], status: int = 200) -> None:
     """Send an HTML response. Body can be str (utf-8) or bytes."""
-    r = self._request
-    r.send_response(status)
-    r.send_header("Content-Type", "text/html; charset=utf-8")
-    r.end_headers()
-    r.wfile.write(body.encode("utf-8") if isinstance(body, str) else body)
+    # str.encode() with no arguments is UTF-8 without the codec-name lookup, and already
+    # copies ASCII-only strings directly. bytes (pre-rendered templates) pass straight through.
+    payload = body.encode() if isinstance(body, str) else body
+    self._send_raw(status, _CT_HTML + b"Content-Length: %d\r\n" % len(payload), payload)
 
   def text(self, body: str, status: int = 200) -> None:
     """Send a plain-text response."""
-    r = self._request
-    r.send_response(status)
-    r.send_header("Content-Type", "text/plain; charset=utf-8")
-    r.end_headers()
-    r.wfile.write(body.encode("utf-8"))
+    payload = body.encode()
+    self._send_raw(status, _CT_TEXT + b"Content-Length: %d\r\n" % len(payload), payload)
 
   def json(self, data: Union[dict, list], status: int = 200) -> None:
-    """Send a JSON response."""
-    r = self._request
-    r.send_response(status)
-    r.send_header("Content-Type", "application/json; charset=utf-8")
-    r.end_headers()
-    r.wfile.write(dumps(data).encode("utf-8"))
+    """Send a JSON response (serialized with orjson when installed)."""
+    payload = _json_dumps(data)
+    self._send_raw(status, _CT_JSON + b"Content-Length: %d\r\n" % len(payload), payload)
 
   def redirect(self, location: str, status: int = 302) -> None:
     """Send a redirect. Default 302; use 301 for permanent."""
-    r = self._request
-    r.send_response(status)
-    r.send_header("Location", location)
-    r.end_headers()
+    self._send_raw(status, b"Location: " + location.encode("latin-1") + b"\r\n" + _CL_ZERO)
 
   def rewrite(self, resp: Response) -> None:
     """
@@ -99,21 +340,19 @@ class ResponseHelper:
       request.response.rewrite(Response("Hello", 200))
       request.response.rewrite(Response({"error": "not found"}, 404))
     """
-    r = self._request
-    r.send_response(resp.status)
-    for key, value in resp.headers.items():
-      r.send_header(key, value)
-    r.end_headers()
-    r.wfile.write(resp.body)
+    header_lines, close = resp.encode_headers()
+    if close:
+      self._request.close_connection = True  # what send_header() would have done
+    self._send_raw(resp.status, header_lines, resp.body)
 
   def streamProxy(
     self,
     url: str,
     method: str = "GET",
-    headers = None,
+    headers: Union[Headers, dict, HTTPMessage, None] = None,
     body: Optional[bytes] = None,
     timeout: int = 30,
-    chunk_size: int = 8192
+    chunk_size: int = 65536
   ) -> None:
     """
     Stream response from URL directly to client without buffering.
@@ -127,44 +366,97 @@ class ResponseHelper:
       request.response.streamProxy(url, headers={"Referer": "https://example.com"})
     """
     r = self._request
-    req_headers = headers.to_proxy_dict()
+    if headers is None:
+      req_headers = {}
+    elif isinstance(headers, Headers):
+      req_headers = headers.to_proxy_dict()
+    else:
+      req_headers = Headers(headers).to_proxy_dict()
 
     try:
-      req = Request(url, data=body, headers=req_headers, method=method)
-      upstream = urlopen(req, timeout=timeout)
-    except HTTPError as upstream:
-      pass  # HTTPError is also a response, continue streaming it
-    except URLError as e:
-      r.send_response(502)
-      r.send_header("Content-Type", "text/plain")
-      r.end_headers()
-      r.wfile.write(f"Bad Gateway: {e.reason}".encode())
-      return
+      # 4xx/5xx come back as normal responses and are streamed like any other
+      conn, upstream = open_url(url, method=method, headers=req_headers, body=body, timeout=timeout)
     except TimeoutError:
-      r.send_response(504)
-      r.send_header("Content-Type", "text/plain")
-      r.end_headers()
-      r.wfile.write(b"Gateway Timeout")
+      self._send_raw(504, *_GATEWAY_TIMEOUT)
+      return
+    except (OSError, HTTPException) as e:
+      message = f"Bad Gateway: {e}".encode()
+      self._send_raw(502, _CT_PLAIN + b"Content-Length: %d\r\n" % len(message), message)
       return
     
-    # Send status and headers (206 for partial content, 200 for full)
-    r.send_response(upstream.status)
-    for key, value in upstream.getheaders():
-      if key.lower() not in HOP_BY_HOP:
-        r.send_header(key, value)
-    # Ensure Accept-Ranges is set for seekable content
-    if not any(h[0].lower() == "accept-ranges" for h in upstream.getheaders()):
-      r.send_header("Accept-Ranges", "bytes")
-    r.end_headers()
+    # Send status and headers (206 for partial content, 200 for full) in one write
+    head = [f"{key}: {value}\r\n" for key, value in filter_hop(upstream.getheaders())]
+    # Content-Length is hop-by-hop filtered above; re-send the decoded length when known.
+    # Otherwise HTTP/1.1 clients get the body chunked (keeping the connection), and older
+    # clients get the end of the body marked by closing the connection.
+    chunked = False
+    if upstream.length is not None:
+      # http.client gives 1xx/204/304 length 0; those responses carry no Content-Length
+      if upstream.status not in _NO_BODY_STATUSES:
+        head.append(f"Content-Length: {upstream.length}\r\n")
+    elif r.request_version >= "HTTP/1.1":
+      chunked = True
+    else:
+      r.close_connection = True
+    header_lines = "".join(head).encode("latin-1")
+    if chunked:
+      header_lines += _CHUNKED
+    # Ensure Accept-Ranges is set for seekable content (case-insensitive HTTPMessage lookup)
+    if "Accept-Ranges" not in upstream.headers:
+      header_lines += _ACCEPT_RANGES
+    self._send_raw(upstream.status, header_lines)
+    if r.command == "HEAD":
+      conn.close()  # no body for the client; the unread upstream body rules out reuse
+      return
     
-    # Stream body in chunks
-    while True:
-      chunk = upstream.read(chunk_size)
-      if not chunk:
-        break
-      r.wfile.write(chunk)
+    # Stream body in chunks; the upstream connection goes back to the pool only if fully read.
+    # Not os.sendfile/splice: the upstream socket may carry TLS, chunked framing and
+    # already-buffered bytes.
+    # Each buffer has _CHUNK_PAD bytes in front of the data and 2 after, so a chunked size
+    # line and trailing CRLF go around it in place and each chunk is still a single write.
+    if upstream.length is not None and upstream.length <= chunk_size:
+      # Fits in one buffer: nothing to overlap, so no reader thread
+      # (a known length also means the body is not chunked)
+      mv = memoryview(bytearray(_CHUNK_PAD + chunk_size + 2))
+      try:
+        n = upstream.readinto(mv[_CHUNK_PAD:_CHUNK_PAD + chunk_size])
+        if n:
+          _write_chunk(r, mv, n, False)
+      except BaseException:
+        conn.close()
+        raise
+      release(conn, upstream)
+      return
     
-    upstream.close()
+    # Double-buffered: a reader thread fills free buffers from upstream while this thread
+    # writes filled ones to the client, so a slow side doesn't stall the other.
+    # Memory stays at _PROXY_BUFFERS * chunk_size.
+    free: queue.SimpleQueue = queue.SimpleQueue()
+    filled: queue.SimpleQueue = queue.SimpleQueue()
+    for _ in range(_PROXY_BUFFERS):
+      free.put(memoryview(bytearray(_CHUNK_PAD + chunk_size + 2)))
+    stop = threading.Event()
+    threading.Thread(
+      target=_read_upstream, args=(conn, upstream, chunk_size, free, filled, stop),
+      name="streamProxy-reader", daemon=True,
+    ).start()
+    try:
+      while True:
+        item = filled.get()
+        if item is None:
+          break
+        if isinstance(item, BaseException):
+          raise item  # upstream read failed; the reader already closed the connection
+        mv, n = item
+        _write_chunk(r, mv, n, chunked)
+        free.put(mv)
+      if chunked:
+        r.wfile.write(b"0\r\n\r\n")
+    except BaseException:
+      # Client gone (or upstream error): tell the reader to stop and drop the connection
+      stop.set()
+      free.put(None)
+      raise
 
   def file(
     self,
@@ -172,7 +464,7 @@ class ResponseHelper:
     mode: Literal["stream", "buffer", "sendfile"] = "sendfile",
     content_type: Optional[str] = None,
     headers: Optional[dict[str, str]] = None,
-    chunk_size: int = 8192,
+    chunk_size: int = 65536,
     simulate_delay_ms: int = 0,
     status: int = 200
   ) -> None:
@@ -186,7 +478,7 @@ class ResponseHelper:
             "buffer" reads into memory first then sends all at once (higher memory usage)
       content_type: MIME type (auto-detected from extension if not provided)
       headers: Additional response headers (e.g., Content-Disposition for download)
-      chunk_size: Chunk size for stream mode (default 8192 bytes)
+      chunk_size: Chunk size for stream mode (default 65536 bytes)
       simulate_delay_ms: Delay in milliseconds between chunks (stream mode only, for testing)
       status: HTTP status code (default 200)
     
@@ -199,106 +491,101 @@ class ResponseHelper:
     """
     r = self._request
     
-    # Check if file exists
-    if not os.path.exists(path):
-      r.send_response(404)
-      r.send_header("Content-Type", "text/plain")
-      r.end_headers()
-      r.wfile.write(b"File not found")
+    # One stat() answers exists / is a regular file / size
+    try:
+      st = os.stat(path)
+    except OSError:
+      self._send_raw(404, *_NOT_FOUND)
       return
     
     # Check if path is a file (not a directory)
-    if not os.path.isfile(path):
-      r.send_response(400)
-      r.send_header("Content-Type", "text/plain")
-      r.end_headers()
-      r.wfile.write(b"Path is not a file")
+    if not stat.S_ISREG(st.st_mode):
+      self._send_raw(400, *_NOT_A_FILE)
       return
     
     # Get file size and detect content type
-    file_size = os.path.getsize(path)
+    file_size = st.st_size
     if content_type is None:
-      content_type, _ = mimetypes.guess_type(path)
-      content_type = content_type or "application/octet-stream"
+      content_type = _guess_content_type(path)
     
     # Parse Range header for partial content support
     range_header = r.headers.get("Range")
     start, end = 0, file_size - 1
     
-    if range_header and range_header.startswith("bytes="):
-      try:
-        range_spec = range_header[6:]  # Remove "bytes="
-        if range_spec.startswith("-"):
-          # Last N bytes: bytes=-500
-          suffix_len = int(range_spec[1:])
-          start = max(0, file_size - suffix_len)
-        elif range_spec.endswith("-"):
-          # From offset to end: bytes=500-
-          start = int(range_spec[:-1])
-        else:
-          # Explicit range: bytes=500-999
-          parts = range_spec.split("-")
-          start = int(parts[0])
-          end = int(parts[1]) if parts[1] else file_size - 1
-        
-        # Validate range
-        if start > end or start >= file_size:
-          r.send_response(416)  # Range Not Satisfiable
-          r.send_header("Content-Range", f"bytes */{file_size}")
-          r.end_headers()
-          return
-        
-        end = min(end, file_size - 1)
-        status = 206  # Partial Content
-      except ValueError:
-        pass  # Invalid range, send full file
+    m = _RANGE_RE.fullmatch(range_header) if range_header else None
+    if m is not None and (m[1] or m[2]):
+      first, last = m[1], m[2]
+      if not first:
+        # Last N bytes: bytes=-500
+        start = max(0, file_size - int(last))
+      else:
+        # From offset to end (bytes=500-) or explicit range (bytes=500-999)
+        start = int(first)
+        if last:
+          end = int(last)
+      
+      # Validate range
+      if start > end or start >= file_size:
+        # Range Not Satisfiable
+        self._send_raw(416, b"Content-Range: bytes */%d\r\n" % file_size + _CL_ZERO)
+        return
+      
+      end = min(end, file_size - 1)
+      status = 206  # Partial Content
+    # Anything else (other units, multiple ranges, malformed): send the full file
     
     content_length = end - start + 1
     
-    # Send headers
-    r.send_response(status)
-    r.send_header("Content-Type", content_type)
-    r.send_header("Content-Length", str(content_length))
-    r.send_header("Accept-Ranges", "bytes")
+    # Send headers: formatted as one string and encoded once, written with the status line
+    head = f"Content-Type: {content_type}\r\nContent-Length: {content_length}\r\n"
     if status == 206:
-      r.send_header("Content-Range", f"bytes {start}-{end}/{file_size}")
+      head += f"Content-Range: bytes {start}-{end}/{file_size}\r\n"
     if headers:
       for key, value in headers.items():
-        r.send_header(key, value)
-    r.end_headers()
+        if _canon(key) == "connection":
+          # Left out: _send_raw sends the server's own Connection header
+          if value.lower() == "close":
+            r.close_connection = True  # what send_header() would have done
+          continue
+        head += f"{key}: {value}\r\n"
+    self._send_raw(status, _ACCEPT_RANGES + head.encode("latin-1"))
+    if content_length == 0 or r.command == "HEAD":
+      return  # no body (and socket.sendfile rejects count=0)
     
     # Send file content
     if mode == "sendfile":
       # Sendfile mode: kernel-level zero-copy transfer (most efficient)
       # Data goes directly from file to socket without copying through Python
       r.wfile.flush()  # Flush any buffered headers
-      socket_fd = r.connection.fileno()
       with open(path, "rb") as f:
-        file_fd = f.fileno()
-        sent = 0
-        while sent < content_length:
-          # os.sendfile returns number of bytes sent (may be less than requested)
-          chunk = os.sendfile(socket_fd, file_fd, start + sent, content_length - sent)
-          if chunk == 0:
-            break  # Connection closed
-          sent += chunk
+        # socket.sendfile loops over os.sendfile until count bytes are sent, and falls back
+        # to plain send() where sendfile isn't available (e.g. TLS sockets, Windows)
+        r.connection.sendfile(f, offset=start, count=content_length)
     elif mode == "buffer":
       # Buffer mode: read entire range into memory, then send all at once
-      with open(path, "rb") as f:
-        f.seek(start)
-        data = f.read(content_length)
-      r.wfile.write(data)
+      if file_size <= _SMALL_FILE_MAX:
+        data = _load_small_file(path, st.st_mtime_ns, file_size)
+        with memoryview(data) as mv:
+          r.wfile.write(mv[start:end + 1])  # no copy of the cached bytes for ranges
+      else:
+        with open(path, "rb") as f:
+          f.seek(start)
+          data = f.read(content_length)
+        r.wfile.write(data)
     else:
       # Stream mode: read and send in chunks (holds file open during transfer)
+      # One reusable buffer (no bigger than the range), filled in place by readinto
+      buf = bytearray(min(chunk_size, content_length))
+      mv = memoryview(buf)
       with open(path, "rb") as f:
         f.seek(start)
         remaining = content_length
         while remaining > 0:
-          read_size = min(chunk_size, remaining)
-          chunk = f.read(read_size)
-          if not chunk:
+          n = f.readinto(mv[:min(chunk_size, remaining)])
+          if not n:
             break
-          r.wfile.write(chunk)
-          remaining -= len(chunk)
+          r.wfile.write(mv[:n])
+          remaining -= n
           if simulate_delay_ms > 0:
+            r.wfile.flush()  # let the client see each chunk before the delay
             time.sleep(simulate_delay_ms / 1000)
@@ -1,4 +1,6 @@
 #! /usr/bin/env python3
+import os
+
 from lib.error import HttpServerError
 from lib.http import HttpServer
 from lib.handler import HttpServerHandler
@@ -6,6 +8,8 @@ from lib.handler import HttpServerHandler
 def handler(request: HttpServerHandler) -> None:
   content_length = request.headers.get("Content-Length")
   body = request.rfile.read(int(content_length)).decode("utf-8") if content_length else ""
+  # One dumps() call on the whole dict: faster than joining pre-encoded keys with
+  # separately serialized values, with orjson and json alike
   data = {
     "path": request.path_no_query,
     "query_params": request.query_params,
@@ -28,7 +32,10 @@ def error_handler(request: HttpServerHandler, error: HttpServerError) -> None:
   request.response.json(error_data, status=error.status_code)
 
 def main():
-  with HttpServer(port=8000, handler=handler, error_handler=error_handler, max_threads=50) as server:
+  # Same sizing rule as ThreadPoolExecutor's default: enough threads to overlap I/O without
+  # oversubscribing CPU-bound JSON work. For CPU-heavy handlers, add workers=N processes.
+  max_threads = min(32, (os.cpu_count() or 1) * 4)
+  with HttpServer(port=8000, handler=handler, error_handler=error_handler, max_threads=max_threads) as server:
     print("Press Ctrl+C to stop the server")
     server.start()
 